@@ -8,26 +8,44 @@ from __future__ import annotations
 import chess
 from chess.engine import PlayResult, Limit
 import chess.engine
+import chess.polyglot
+import numpy as np
 import random
 from lib.engine_wrapper import MinimalEngine, MOVE
 from typing import Any, Optional, Union
 import logging
 from lib.config import Configuration
 import sys
-from stockfish import Stockfish
 from lib.conversation import Conversation, ChatLine
 import lichess_bot
 
 stockfishPath = "engines\\stockfish.exe"
-stockfish = Stockfish(path=stockfishPath)
+_STOCKFISH = None
+
+def get_engine():
+    """Return the shared Stockfish process, starting it on first use."""
+    global _STOCKFISH
+    if _STOCKFISH is None:
+        _STOCKFISH = chess.engine.SimpleEngine.popen_uci(stockfishPath)
+    return _STOCKFISH
+
+def close_engine():
+    """Shut down the shared Stockfish process if it is running."""
+    global _STOCKFISH
+    if _STOCKFISH is not None:
+        _STOCKFISH.close()
+        _STOCKFISH = None
+
+_LAST_MOVE_TYPE = None
 
 def create_file(file_name, text):
-    try:
-        with open(file_name, 'w') as file:
-            file.write(text)
-        print(f"File '{file_name}' created successfully with the given text.")
-    except Exception as e:
-        print(f"Error occurred while creating the file: {e}")
+    global _LAST_MOVE_TYPE
+    if text == _LAST_MOVE_TYPE:
+        return
+    _LAST_MOVE_TYPE = text
+    with open(file_name, 'w') as file:
+        file.write(text)
+    logger.debug("File '%s' created successfully with the given text.", file_name)
 
 # Use this logger variable to print messages to the console or log files.
 # logger.info("message") will always print "message" to the console or log file.
@@ -57,7 +75,7 @@ class Alphabetical(ExampleEngine):
     def search(self, board: chess.Board, *args: Any) -> PlayResult:
         """Choose the first move alphabetically."""
         moves = list(board.legal_moves)
-        print(board)
+        logger.debug("%s", board)
         moves.sort(key=board.san)
         return PlayResult(moves[0], None)
 
@@ -68,10 +86,7 @@ class FirstMove(ExampleEngine):
     def search(self, board: chess.Board, *args: Any) -> PlayResult:
         """Choose the first move alphabetically in uci representation."""
         moves = list(board.legal_moves)
-        moves.sort(key=str)
-        print(PlayResult(moves[0], None))
-        print("----")
-        print(moves[0])
+        moves.sort(key=chess.Move.uci)
         return PlayResult(moves[0], None)
 
 
@@ -96,145 +111,163 @@ class ComboEngine(ExampleEngine):
         if isinstance(time_limit.time, int):
             my_time = time_limit.time
             my_inc = 0
-        elif board.turn == chess.WHITE:
-            my_time = time_limit.white_clock if isinstance(time_limit.white_clock, int) else 0
-            my_inc = time_limit.white_inc if isinstance(time_limit.white_inc, int) else 0
         else:
-            my_time = time_limit.black_clock if isinstance(time_limit.black_clock, int) else 0
-            my_inc = time_limit.black_inc if isinstance(time_limit.black_inc, int) else 0
+            is_white = board.turn == chess.WHITE
+            my_time = (time_limit.white_clock if is_white else time_limit.black_clock) or 0
+            my_inc = (time_limit.white_inc if is_white else time_limit.black_inc) or 0
 
         possible_moves = root_moves if isinstance(root_moves, list) else list(board.legal_moves)
 
-        if my_time / 60 + my_inc > 10:
+        if my_time + 60 * my_inc > 600:
             # Choose a random move.
             move = random.choice(possible_moves)
         else:
             # Choose the first move alphabetically in uci representation.
-            possible_moves.sort(key=str)
+            possible_moves.sort(key=chess.Move.uci)
             move = possible_moves[0]
         return PlayResult(move, None, draw_offered=draw_offered)
 
+_MOVE_TYPES = ("Best", "Best", "Best", "Random", "Worst", "Capture") #, "Capture", "Check"
+_RANDRANGE = random.randrange
+
 class TestFish(ExampleEngine):
     def __init__ (self, *args, cwd):
-        self.stockfish = chess.engine.SimpleEngine.popen_uci(stockfishPath)
+        self.stockfish = get_engine()
+        self.moveHandlers = {
+            "Best": self.searchBest,
+            "Random": self.searchRandom,
+            "Capture": self.searchCapture,
+            "Worst": self.searchWorst,
+        }
         super().__init__(*args)
     def evaluate (self, board, timeLimit = 0.1):
         result = self.stockfish.analyse(board, chess.engine.Limit(time = timeLimit - 0.01))
-        print(result["score"].relative)
-        return result["score"].relative
-    
+        logger.debug("%s", result["score"].relative)
+        # Coerce to a plain int (mates become +/-100000ish) so callers compare ints, not Score objects.
+        return result["score"].relative.score(mate_score = 100000)
+
     def search(self, board: chess.Board, timeLeft, *args) -> PlayResult:
-        move_type = random.choice(["Best", "Best", "Best", "Random", "Worst","Capture"]) #, "Capture", "Check"
+        move_type = _MOVE_TYPES[_RANDRANGE(len(_MOVE_TYPES))]
         create_file("move_type.txt", move_type)
-        if move_type == "Best":
-            print("Best")
-##            stockfish.set_depth(15) #dont use pls
-            stockfish.set_fen_position(board.fen())
-##            movelsit = stockfish.get_top_moves(1)
-##            print(movelsit)
-            bmove = stockfish.get_best_move()
-            print("BMOVE: "+bmove)
-##            topmoves = stockfish.get_top_moves()
-##            print(topmoves)
-##            print(topmoves[0])
-            return PlayResult(bmove, None)
-        elif move_type == "Random":
-            print("Random")
-            return PlayResult(random.choice(list(board.legal_moves)), None)
-        elif move_type == "Capture":
-            captures = []
-            legalMoves = tuple(board.legal_moves)
-            for move in legalMoves:
-                if board.is_capture(move):
-                    captures.append(move)
-            if captures:
-                return PlayResult(random.choice(list(captures)), None)
-            stockfish.set_fen_position(board.fen())
-            bmove = stockfish.get_best_move()
-            print("BMOVE: "+bmove)
-            return PlayResult(bmove, None)
-        elif move_type == "Worst":
-            legalMoves = tuple(board.legal_moves)
-            searchTime = 0.1
-            if type(timeLeft) != chess.engine.Limit:
-                timeLeft /= 1000  # Convert to seconds
-                if len(legalMoves) * searchTime > timeLeft / 10:
-                    searchTime = (timeLeft / 10) / len(legalMoves)
-            worstEvaluation = None
-            worstMoves = []
-            for move in legalMoves:
-                move.isCapture = board.is_capture(move)
-                board.push(move)
-                move.isCheck = board.is_check()
-                evaluation = self.evaluate(board, searchTime)
-                if worstEvaluation is None or worstEvaluation < evaluation:
-                    worstEvaluation = evaluation
-                    worstMoves = [move]
-                elif worstEvaluation == evaluation:
-                    worstMoves.append(move)
-                board.pop()
-            worstCaptures = []
-            worstChecks = []
-            worstOther = []
-            for move in worstMoves:
-                if move.isCapture:
-                    worstCaptures.append(move)
-                elif move.isCheck:
-                    worstChecks.append(move)
-                else:
-                    worstOther.append(move)
-            if len(worstOther) != 0:
-                return PlayResult(random.choice(worstOther), None)
-            elif len(worstChecks) != 0:
-                return PlayResult(random.choice(worstChecks), None)
-            else:
-                return PlayResult(random.choice(worstCaptures), None)
+        conversation = getattr(self, "conversation", None)
+        if conversation:
+            conversation.on_move_type(move_type)
+        return self.moveHandlers[move_type](board, timeLeft)
+
+    def searchBest(self, board, timeLeft):
+        logger.debug("Best")
+        bmove = self.stockfish.play(board, chess.engine.Limit(depth = 15)).move
+        logger.debug("BMOVE: %s", bmove)
+        return PlayResult(bmove, None)
+
+    def searchRandom(self, board, timeLeft):
+        logger.debug("Random")
+        return PlayResult(random.choice(list(board.legal_moves)), None)
+
+    def searchCapture(self, board, timeLeft):
+        captures = []
+        legalMoves = tuple(board.legal_moves)
+        for move in legalMoves:
+            if board.is_capture(move):
+                captures.append(move)
+        if captures:
+            return PlayResult(random.choice(list(captures)), None)
+        bmove = self.stockfish.play(board, chess.engine.Limit(depth = 15)).move
+        logger.debug("BMOVE: %s", bmove)
+        return PlayResult(bmove, None)
+
+    def searchWorst(self, board, timeLeft):
+        legalMoves = tuple(board.legal_moves)
+        if len(legalMoves) == 1:
+            return PlayResult(legalMoves[0], None)
+        searchTime = 0.1
+        if type(timeLeft) != chess.engine.Limit:
+            timeLeft /= 1000  # Convert to seconds
+            if len(legalMoves) * searchTime > timeLeft / 10:
+                searchTime = (timeLeft / 10) / len(legalMoves)
+        theirPieces = board.occupied_co[not board.turn]
+        # Child scores are from the opponent's point of view, so the worst move is the highest one.
+        worstEvaluation = None
+        worstMoves = []
+        for move in legalMoves:
+            move.isCapture = bool(chess.BB_SQUARES[move.to_square] & theirPieces) or board.is_en_passant(move)
+            move.isCheck = board.gives_check(move)
+            child = board.copy(stack=False)
+            child.push(move)
+            evaluation = self.evaluate(child, searchTime)
+            if worstEvaluation is None or evaluation > worstEvaluation:
+                worstEvaluation = evaluation
+                worstMoves = [move]
+            elif evaluation == worstEvaluation:
+                worstMoves.append(move)
+        # Flags are 0 = quiet, 1 = check, 2 = capture; prefer quiet moves, then checks, then captures.
+        flags = np.fromiter((2 if move.isCapture else 1 if move.isCheck else 0 for move in worstMoves),
+                            dtype=np.uint8, count=len(worstMoves))
+        for wanted in (0, 1, 2):
+            indices = np.flatnonzero(flags == wanted)
+            if indices.size:
+                return PlayResult(worstMoves[np.random.choice(indices)], None)
 class WorstFish(ExampleEngine):
 
+    _TT_MAX = 1 << 20
+    # Centipawn window around the quick-pass worst score that still counts as tied.
+    _EPSILON = 50
+
     def __init__ (self, *args, cwd):
-        self.stockfish = chess.engine.SimpleEngine.popen_uci(stockfishPath)
+        self.stockfish = get_engine()
+        # Transposition table: zobrist hash -> (scored root moves, time budget they were searched with).
+        self._tt = {}
         super().__init__(*args)
 
-    def evaluate (self, board, timeLimit = 0.1):
-        result = self.stockfish.analyse(board, chess.engine.Limit(time = timeLimit - 0.01))
-        print(result["score"].relative)
-        return result["score"].relative
-
     def search (self, board: chess.Board, timeLeft, *args):
         legalMoves = tuple(board.legal_moves)
+        if len(legalMoves) == 1:
+            return PlayResult(legalMoves[0], None)
         searchTime = 0.1
         if type(timeLeft) != chess.engine.Limit:
             timeLeft /= 1000  # Convert to seconds
             if len(legalMoves) * searchTime > timeLeft / 10:
                 searchTime = (timeLeft / 10) / len(legalMoves)
+        totalBudget = searchTime * len(legalMoves)
+        # Quick scouting pass over every root move, then spend the rest of the
+        # budget only on the moves still tied for worst.
+        quickBudget = min(0.02 * len(legalMoves), totalBudget / 2)
+        key = chess.polyglot.zobrist_hash(board)
+        cached = self._tt.get(key)
+        if cached is not None and cached[1] >= quickBudget:
+            scoredMoves = cached[0]
+        else:
+            infos = self.stockfish.analyse(board, chess.engine.Limit(time = quickBudget), multipv = len(legalMoves))
+            scoredMoves = [(info["pv"][0], info["score"].relative.score(mate_score = 100000)) for info in infos]
+            if len(self._tt) >= self._TT_MAX:
+                self._tt.clear()
+            self._tt[key] = (scoredMoves, quickBudget)
+        # Root multipv scores are ints from our point of view, so the worst move is the lowest one.
+        worstScore = min(score for move, score in scoredMoves)
+        cluster = [(move, score) for move, score in scoredMoves if score <= worstScore + self._EPSILON]
+        if len(cluster) > 1 and totalBudget > quickBudget:
+            clusterMoves = [move for move, score in cluster]
+            infos = self.stockfish.analyse(board, chess.engine.Limit(time = totalBudget - quickBudget),
+                                           multipv = len(clusterMoves), root_moves = clusterMoves)
+            cluster = [(info["pv"][0], info["score"].relative.score(mate_score = 100000)) for info in infos]
         worstEvaluation = None
         worstMoves = []
-        for move in legalMoves:
-            move.isCapture = board.is_capture(move)
-            board.push(move)
-            move.isCheck = board.is_check()
-            evaluation = self.evaluate(board, searchTime)
-            if worstEvaluation is None or worstEvaluation < evaluation:
+        for move, evaluation in cluster:
+            if worstEvaluation is None or evaluation < worstEvaluation:
                 worstEvaluation = evaluation
                 worstMoves = [move]
             elif worstEvaluation == evaluation:
                 worstMoves.append(move)
-            board.pop()
-        worstCaptures = []
-        worstChecks = []
-        worstOther = []
+        theirPieces = board.occupied_co[not board.turn]
         for move in worstMoves:
-            if move.isCapture:
-                worstCaptures.append(move)
-            elif move.isCheck:
-                worstChecks.append(move)
-            else:
-                worstOther.append(move)
-        if len(worstOther) != 0:
-            return PlayResult(random.choice(worstOther), None)
-        elif len(worstChecks) != 0:
-            return PlayResult(random.choice(worstChecks), None)
-        else:
-            return PlayResult(random.choice(worstCaptures), None)
+            move.isCapture = bool(chess.BB_SQUARES[move.to_square] & theirPieces) or board.is_en_passant(move)
+            move.isCheck = board.gives_check(move)
+        # Flags are 0 = quiet, 1 = check, 2 = capture; prefer quiet moves, then checks, then captures.
+        flags = np.fromiter((2 if move.isCapture else 1 if move.isCheck else 0 for move in worstMoves),
+                            dtype=np.uint8, count=len(worstMoves))
+        for wanted in (0, 1, 2):
+            indices = np.flatnonzero(flags == wanted)
+            if indices.size:
+                return PlayResult(worstMoves[np.random.choice(indices)], None)
     def quit(self):
-        self.stockfish.close()
+        close_engine()
@@ -7,8 +7,6 @@ from collections.abc import Sequence
 from lib.timer import seconds
 from typing import Union
 import threading
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 
 logger = logging.getLogger(__name__)
 
@@ -31,8 +29,8 @@ class Conversation:
         self.li = li
         self.version = version
         self.challengers = challenge_queue
-        self.observer = None
-        self.observer_enabled = False
+        self.move_teller_enabled = False
+        engine.conversation = self
 
     command_prefix = "!"
 
@@ -43,8 +41,8 @@ class Conversation:
         :param line: Information about the message.
         """
         logger.info(f'*** {self.game.url()} [{line.room}] {line.username}: {line.text}')
-        if line.text[0] == self.command_prefix:
-            self.command(line, line.text[1:].lower())
+        if line.text.startswith(self.command_prefix):
+            self.command(line, line.text[len(self.command_prefix):].lower())
 
     def command(self, line: ChatLine, cmd: str) -> None:
         """
@@ -54,8 +52,8 @@ class Conversation:
         :param cmd: The command to react to.
         """
         from_self = line.username == self.game.username
-        if "tellmoves" in cmd.lower():
-            self.toggle_file_observer()
+        if "tellmoves" in cmd:
+            self.toggle_move_teller()
         if cmd == "commands" or cmd == "help":
             self.send_reply(line, "Supported commands: !wait (wait a minute for my first move), !name, !howto, !eval, !queue")
         elif cmd == "wait" and self.game.is_abortable():
@@ -95,31 +93,25 @@ class Conversation:
         if message:
             self.send_reply(ChatLine({"room": room, "username": "", "text": ""}), message)
 
-    def toggle_file_observer(self) -> None:
-        """Toggle file change observer on 'move_type.txt'."""
-        if self.observer_enabled:
-            self.stop_file_observer()
-            self.observer_enabled = False
+    def toggle_move_teller(self) -> None:
+        """Toggle telling the chat which move type the engine picked."""
+        if self.move_teller_enabled:
+            self.move_teller_enabled = False
             self.send_message("player", "Stopped Move Teller")
         else:
-            self.start_file_observer()
-            self.observer_enabled = True
+            self.move_teller_enabled = True
             self.send_message("player", "Started Move Teller")
 
-    def start_file_observer(self) -> None:
-        """Start file change observer on 'move_type.txt'."""
-        if not self.observer:
-            event_handler = FileChangeHandler(self)
-            self.observer = Observer()
-            self.observer.schedule(event_handler, ".", recursive=False)
-            self.observer.start()
-
-    def stop_file_observer(self) -> None:
-        """Stop file change observer."""
-        if self.observer:
-            self.observer.stop()
-            self.observer.join()
-            self.observer = None
+    def on_move_type(self, move_type: str) -> None:
+        """
+        Tell the chat which move type the engine picked.
+
+        Called directly by the engine, so no file observer thread is needed.
+
+        :param move_type: The move type the engine picked.
+        """
+        if self.move_teller_enabled:
+            self.send_message("player", move_type)
 
 class ChatLine:
     """Information about the message."""
@@ -133,18 +125,6 @@ class ChatLine:
         self.text = message_info["text"]
         """The message sent."""
 
-class FileChangeHandler(FileSystemEventHandler):
-    """Handler for file system events."""
-    
-    def __init__(self, conversation: Conversation) -> None:
-        self.conversation = conversation
-
-    def on_modified(self, event):
-        if event.src_path.endswith("move_type.txt"):
-            with open(event.src_path, "r") as file:
-                content = file.read()
-                self.conversation.send_message("player", content)
-
 # Example Usage:
 # conversation = Conversation(game, engine, li, version, challenge_queue)
 # conversation.react(ChatLine({"room": "room_name", "username": "user_name", "text": "!tellmoves"}))